@@ -1,23 +1,79 @@
+import contextlib
+import functools
 import json
+import os
+import queue
 import shutil
 import sys
-import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections.abc import Iterator
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, BinaryIO, Optional, Protocol
+from urllib.parse import quote
 
-import requests
 from invoke import Context, task
-
-# rich.progress is fancier but much slower (100ms import)
-# so use simpler progress library (also used by pip, before rich):
-from progress.bar import ChargingBar
-from requests_toolbelt.multipart.encoder import MultipartEncoder, MultipartEncoderMonitor
 from rich import print
 from threadful import thread
 from threadful.bonus import animate
 
+if TYPE_CHECKING:
+    # edwh imports every plugin on startup, so heavier imports happen only when a task actually needs them.
+    # requests alone takes ~40ms to import.
+    import requests
+    from progress.bar import ChargingBar
+
 DEFAULT_TRANSFERSH_SERVER = "https://files.edwh.nl"
 
+# copy file data in 1 MiB blocks instead of the 8 KiB that zipfile/shutil use by default
+BUFFER_SIZE = 1024 * 1024
+
+# how much of a large file to test-compress when deciding whether to deflate it in a .zip:
+COMPRESSION_SAMPLE_SIZE = 256 * 1024
+
+# these formats are already compressed and barely shrink, so they're stored in a .zip as-is:
+COMPRESSED_EXTENSIONS = frozenset(
+    # archives:
+    ".7z .br .bz2 .gz .lz4 .rar .tgz .xz .zip .zst "
+    # zip-based documents and packages:
+    ".docx .jar .odt .pptx .whl .xlsx "
+    # media and columnar data:
+    ".avi .gif .jpeg .jpg .mkv .mov .mp3 .mp4 .ogg .png .webm .webp .parquet".split()
+)
+
+
+@functools.cache
+def session() -> "requests.Session":
+    """
+    Shared requests session, so multiple calls in one process reuse connections (and their TLS handshakes).
+
+    Failures to connect are retried with backoff for every method, since no request was sent yet.
+    Read errors and 502/503/504 responses are only retried for GET and DELETE,
+    and other errors (e.g. TLS failing halfway through a request) are never retried:
+    upload bodies are streams that can't be replayed, so a retry would store a truncated file.
+    When the retries run out, the last response is returned instead of raising, so callers can report its status.
+    """
+    # imported lazily, see the TYPE_CHECKING imports above:
+    import requests  # noqa: PLC0415
+    from requests.adapters import HTTPAdapter, Retry  # noqa: PLC0415
+
+    retries = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "DELETE"}),
+        # urllib3 doesn't check allowed_methods for these (e.g. SSLError), so disable them for all methods:
+        other=0,
+        raise_on_status=False,
+    )
+
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(max_retries=retries))
+    s.mount("https://", HTTPAdapter(max_retries=retries))
+    return s
+
 
 def require_protocol(url: str):
     """
@@ -26,60 +82,306 @@ def require_protocol(url: str):
     return url if url.startswith(("http://", "https://")) else f"https://{url}"
 
 
-def create_callback(encoder: MultipartEncoder):
-    bar = ChargingBar("Uploading", max=encoder.len)
+def fadvise(f: BinaryIO, advice: int):
+    """
+    Tell the kernel how a file will be accessed, e.g. fadvise(f, os.POSIX_FADV_SEQUENTIAL).
 
-    def callback(monitor: MultipartEncoderMonitor):
-        # goto instead of next because chunk size is unknown
-        bar.goto(monitor.bytes_read)
+    Only a hint, so errors (e.g. ESPIPE for a pipe or FIFO) are ignored.
+    Callers check for os.posix_fadvise first, since macOS and Windows don't have it (or the advice constants).
+    """
+    with contextlib.suppress(OSError):
+        os.posix_fadvise(f.fileno(), 0, 0, advice)
 
-    return callback
 
+def upload_url(url: str, filename: str) -> str:
+    """
+    Build the url to PUT 'filename' to on a transfer.sh server.
+    """
+    return f"{url.rstrip('/')}/{quote(filename)}"
 
-def upload_file(url: str, filename: str, filepath: Path, headers: Optional[dict] = None) -> requests.Response:
+
+class Readable(Protocol):
+    """
+    What ProgressReader needs from a file: a regular file, or the raw response of a download (urllib3 HTTPResponse).
+    """
+
+    def read(self, size: int = -1, /) -> bytes: ...
+
+    def tell(self) -> int: ...
+
+
+class ProgressReader:
+    """
+    Wrap a binary file so the bytes read from it move a progress bar.
+
+    Used for the request body of uploads, and for the raw response of downloads.
+    Progress follows f.tell(), so 'bar.max' should be the size of the file (or the Content-Length of the response).
+    Reads can be small (urllib3 sends uploads in 16 KiB blocks),
+    so the bar is only repainted after 1 MiB or ~30 times per second, whichever comes first.
+    """
+
+    def __init__(self, f: Readable, bar: "ChargingBar", refresh_interval: float = 1 / 30):
+        self._file = f
+        self._bar = bar
+        self._refresh_interval = refresh_interval
+        self._pending = 0
+        self._last_refresh = time.monotonic()
+
+    def __len__(self) -> int:
+        # used by requests to set the Content-Length
+        return int(self._bar.max)
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file.read(size)
+        self._pending += len(chunk)
+
+        now = time.monotonic()
+        # empty chunk = EOF, so always show the final state:
+        if not chunk or self._pending >= BUFFER_SIZE or now - self._last_refresh >= self._refresh_interval:
+            # use the position in the file instead of counting the bytes returned:
+            # a download with Content-Encoding returns decoded bytes, while the bar's max is the encoded size.
+            self._bar.goto(self._file.tell())
+            self._pending = 0
+            self._last_refresh = now
+
+        return chunk
+
+
+def upload_file(url: str, filename: str, filepath: Path, headers: Optional[dict] = None) -> "requests.Response":
     """
     Upload a file to an url.
+
+    The file is sent as raw request body (PUT /filename), which transfer.sh supports next to multipart POST.
+    This way requests/urllib3 can stream the file directly, without multipart framing around every chunk.
+    """
+    # rich.progress is fancier but much slower (100ms import)
+    # so use simpler progress library (also used by pip, before rich):
+    from progress.bar import ChargingBar  # noqa: PLC0415
+
+    with filepath.open("rb") as f, ChargingBar("Uploading", max=os.fstat(f.fileno()).st_size) as bar:
+        can_fadvise = hasattr(os, "posix_fadvise")
+        if can_fadvise:
+            fadvise(f, os.POSIX_FADV_SEQUENTIAL)
+        try:
+            return session().put(upload_url(url, filename), data=ProgressReader(f, bar), headers=headers)
+        finally:
+            if can_fadvise:
+                # the file is read only once, so don't let it push more useful data out of the page cache:
+                fadvise(f, os.POSIX_FADV_DONTNEED)
+
+
+def _walk_directory(root: str | Path) -> Iterator[tuple[str, str, bool]]:
     """
-    if headers is None:
-        headers = {}
+    Recursively list everything below 'root' as (path, arcname, is_dir) tuples.
 
-    with filepath.open("rb") as f:
-        encoder = MultipartEncoder(
-            fields={
-                filename: (filename, f, "text/plain"),
-            }
-        )
+    Uses os.scandir so the entry type comes from the directory listing itself,
+    instead of building a Path and doing an extra stat() for every entry like rglob + is_file.
+    Symlinked directories are listed but not followed (same as rglob).
+    """
+    stack = [(str(root), "")]
+    while stack:
+        directory, prefix = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                arcname = prefix + entry.name
+                if entry.is_dir():
+                    yield entry.path, arcname, True
+                    if not entry.is_symlink():
+                        stack.append((entry.path, f"{arcname}/"))
+                elif entry.is_file():
+                    yield entry.path, arcname, False
+
+
+class BlockQueue:
+    """
+    Pass a stream of bytes from one thread to another, like a pipe with a much larger buffer.
+
+    The writing side uses it as a (write-only, unseekable) file,
+    the reading side iterates over blocks of about 'block_size' bytes.
+    At most 'max_blocks' blocks are buffered, so memory use stays bounded when one side is slower.
+    """
+
+    def __init__(self, block_size: int = BUFFER_SIZE, max_blocks: int = 8):
+        self._queue: queue.Queue[bytes] = queue.Queue(maxsize=max_blocks)
+        self._buffer = bytearray()
+        self._block_size = block_size
+        self._abandoned = threading.Event()
+
+    def _put(self, block: bytes):
+        # don't block forever if the reader is gone:
+        while not self._abandoned.is_set():
+            try:
+                self._queue.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+        msg = "Reading side of the BlockQueue stopped."
+        raise BrokenPipeError(msg)
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self._block_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+        return len(data)
+
+    def flush(self):
+        """
+        Data is only passed on per block, so there is nothing to flush.
+        """
+
+    def close(self):
+        """
+        Called by the writer when done: pass on the remaining data and signal the end of the stream.
+        """
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+        self._put(b"")
+
+    def abandon(self):
+        """
+        Called when the stream is given up on (e.g. failed or interrupted upload).
+
+        Both sides then fail with a BrokenPipeError instead of waiting forever for each other.
+        """
+        self._abandoned.set()
+
+    def _get(self) -> bytes:
+        # don't block forever if the stream was abandoned (the writer may never send the end of the stream):
+        while not self._abandoned.is_set():
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+        msg = "The BlockQueue was abandoned."
+        raise BrokenPipeError(msg)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while block := self._get():
+            yield block
+
+
+def _should_deflate(path: str, size: int) -> bool:
+    """
+    Decide whether a file is worth deflating, instead of storing it in a .zip as-is.
+
+    Known compressed formats are never deflated.
+    For large files with another extension, a sample is test-compressed at the fastest level:
+    if that doesn't save at least 10%, deflating the whole file would mostly waste CPU.
+    """
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return False
+
+    if size < BUFFER_SIZE:
+        # small files are cheap to deflate anyway
+        return True
+
+    with open(path, "rb") as f:
+        sample = f.read(COMPRESSION_SAMPLE_SIZE)
+
+    return len(zlib.compress(sample, 1)) < 0.9 * len(sample)
+
+
+def _write_zip(dir_path: str | Path, target: str | Path | BinaryIO | BlockQueue, buffer_size: int = BUFFER_SIZE):
+    """
+    Write a directory as .zip archive to 'target' (a path, a writable binary stream or a BlockQueue).
+
+    Works like `shutil.make_archive(file_path, "zip", dir_path)`,
+    but streams every file into the archive in blocks of 'buffer_size' bytes.
+    The target does not have to be seekable, so the archive can also be streamed to another thread.
+    """
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as zip_object:
+        for path, arcname, is_dir in _walk_directory(dir_path):
+            if is_dir:
+                zip_object.write(path, arcname)
+                continue
 
-        monitor = MultipartEncoderMonitor(encoder, create_callback(encoder))
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            if _should_deflate(path, info.file_size):
+                info.compress_type = zipfile.ZIP_DEFLATED
+            else:
+                info.compress_type = zipfile.ZIP_STORED
 
-        return requests.post(url, data=monitor, headers=headers | {"Content-Type": monitor.content_type})  # noqa
+            with open(path, "rb") as src, zip_object.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst, buffer_size)
 
 
 @thread()
-def _zip_directory(dir_path: str | Path, file_path: str | Path):
+def _zip_directory(dir_path: str | Path, file_path: str | Path, buffer_size: int = BUFFER_SIZE):
     """
     Compress a directory into a .zip file.
     """
-    return shutil.make_archive(str(file_path), "zip", str(dir_path))
+    archive_path = f"{file_path}.zip"
+    _write_zip(dir_path, archive_path, buffer_size)
+    return archive_path
 
 
-def zip_directory(dir_path: str | Path, file_path: str | Path):
+def zip_directory(dir_path: str | Path, file_path: str | Path, buffer_size: int = BUFFER_SIZE):
     """
     Compress a directory into a .zip file and show a spinning animation.
+
+    1 MiB blocks are the sweet spot for zlib; much smaller buffers spend most time on per-call overhead.
     """
-    return animate(_zip_directory(dir_path, file_path), text=f"Zipping directory {dir_path}")
+    return animate(_zip_directory(dir_path, file_path, buffer_size), text=f"Zipping directory {dir_path}")
 
 
-def upload_directory(url: str, filepath: Path, headers: Optional[dict] = None):
+@thread()
+def _zip_to_queue(dir_path: str | Path, blocks: BlockQueue, buffer_size: int = BUFFER_SIZE):
     """
-    Zip a directory and upload it to an url.
+    Compress a directory into a BlockQueue.
+
+    The queue is always closed afterwards (also on error), so the reading side sees the end of the stream.
     """
-    filename = filepath.resolve().name
+    try:
+        _write_zip(dir_path, blocks, buffer_size)
+    finally:
+        blocks.close()
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        archive_path = zip_directory(filepath, Path(tmpdir) / filename)
 
-        return upload_file(url, f"{filename}.zip", Path(archive_path), headers=headers)
+@thread()
+def _upload_stream(url: str, chunks: Iterator[bytes], headers: Optional[dict] = None) -> "requests.Response":
+    """
+    Upload data of unknown length to an url (using chunked transfer encoding).
+    """
+    return session().put(url, data=chunks, headers=headers)
+
+
+def upload_directory(url: str, filepath: Path, headers: Optional[dict] = None) -> "requests.Response":
+    """
+    Zip a directory and upload it to an url.
+
+    The archive is streamed into the request body while it's being written (via a bounded BlockQueue),
+    so zipping and uploading overlap and the archive is never stored on disk.
+    """
+    filename = f"{filepath.resolve().name}.zip"
+    uploaded = 0
+
+    blocks = BlockQueue()
+    zipper = _zip_to_queue(filepath, blocks)
+    zipper.start()
+
+    def stream() -> Iterator[bytes]:
+        nonlocal uploaded
+        for block in blocks:
+            uploaded += len(block)
+            yield block
+
+        # re-raise errors from the zip thread, so a truncated archive aborts the upload:
+        zipper.join()
+
+    try:
+        return animate(
+            _upload_stream(upload_url(url, filename), stream(), headers),
+            text=lambda: f"Zipping and uploading {filename} ({uploaded / 1024 / 1024:.1f} MiB)",
+        )
+    finally:
+        # stops both the zip thread and the upload thread if the upload ended early (error or Ctrl-C):
+        blocks.abandon()
 
 
 @task(aliases=("add", "send"))
@@ -118,7 +420,7 @@ def upload(
     if filepath.is_dir():
         response = upload_directory(url, filepath, headers)
     else:
-        response = upload_file(url, str(filename), filepath, headers)
+        response = upload_file(url, filepath.name, filepath, headers)
 
     download_url = response.text.strip()
     delete_url = response.headers.get("x-url-delete")
@@ -157,16 +459,29 @@ def download(_: Context, download_url: str, output_file: Optional[str | Path] =
     if decrypt:
         headers["X-Decrypt-Password"] = decrypt
 
-    response = requests.get(download_url, headers=headers, stream=True)  # noqa
+    response = session().get(download_url, headers=headers, stream=True)
 
     if response.status_code >= 400:
         print("[red] Something went wrong: [/red]", response.status_code, response.content.decode(), file=sys.stderr)
         return
 
-    total = int(response.headers["Content-Length"]) // 1024
-    with (open(output_file, "wb") as f,):  # <- open file when we're sure the status code is successful!
-        for chunk in ChargingBar("Downloading", max=total).iter(response.iter_content(chunk_size=1024)):
-            f.write(chunk)
+    # let urllib3 undo any Content-Encoding, like iter_content would:
+    response.raw.decode_content = True
+
+    # open file when we're sure the status code is successful!
+    with open(output_file, "wb") as f:
+        content_length = response.headers.get("Content-Length")
+        if not content_length or not sys.stderr.isatty():
+            # no terminal to show a progress bar on (e.g. CI or redirected output),
+            # or no known size to show progress of (e.g. chunked response), so just copy:
+            shutil.copyfileobj(response.raw, f, BUFFER_SIZE)
+            return
+
+        # imported lazily, see upload_file:
+        from progress.bar import ChargingBar  # noqa: PLC0415
+
+        with ChargingBar("Downloading", max=int(content_length)) as bar:
+            shutil.copyfileobj(ProgressReader(response.raw, bar), f, BUFFER_SIZE)
 
 
 @task(aliases=("remove",))
@@ -180,7 +495,7 @@ def delete(_: Context, deletion_url: str):
     """
     deletion_url = require_protocol(deletion_url)
 
-    response = requests.delete(deletion_url, timeout=15)
+    response = session().delete(deletion_url, timeout=15)
 
     print(
         {
@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2023-present Remco Boerma <remco.b@educationwarehouse.nl>
+#
+# SPDX-License-Identifier: MIT
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from threadful import thread
+
+from edwh_files_plugin import files_plugin
+from edwh_files_plugin.files_plugin import BlockQueue
+
+
+def _wait_for_threads(threads: list[threading.Thread], timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        # plain Thread.join: threadful's join would re-raise the (expected) error of a stopped thread
+        threading.Thread.join(t, max(deadline - time.monotonic(), 0))
+
+    assert not any(t.is_alive() for t in threads)
+
+
+def test_abandon_stops_blocked_writer():
+    blocks = BlockQueue(block_size=4, max_blocks=1)
+    errors = []
+
+    def writer():
+        try:
+            while True:
+                blocks.write(b"data")
+        except BrokenPipeError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=writer)
+    t.start()
+    time.sleep(0.2)  # let the writer fill the queue and block
+
+    blocks.abandon()
+    _wait_for_threads([t])
+    assert errors
+
+
+def test_abandon_stops_waiting_reader():
+    # the writer never closes the queue (e.g. it failed after abandon() itself),
+    # so the reader must not wait for the end of the stream forever:
+    blocks = BlockQueue(block_size=4)
+    blocks.write(b"data")
+    received = []
+    errors = []
+
+    def reader():
+        try:
+            for block in blocks:
+                received.append(block)
+        except BrokenPipeError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=reader)
+    t.start()
+    time.sleep(0.2)
+
+    blocks.abandon()
+    _wait_for_threads([t])
+    assert received == [b"data"]
+    assert errors
+
+
+def _other_threads() -> list[threading.Thread]:
+    return [t for t in threading.enumerate() if t is not threading.current_thread()]
+
+
+def test_upload_directory_reraises_zip_error(monkeypatch, tmp_path: Path):
+    def failing_zip(_dir_path, target, _buffer_size):
+        target.write(b"x" * 10)
+        msg = "cannot read file"
+        raise PermissionError(msg)
+
+    @thread()
+    def fake_upload(_url, chunks, _headers):
+        return b"".join(chunks)
+
+    monkeypatch.setattr(files_plugin, "_write_zip", failing_zip)
+    monkeypatch.setattr(files_plugin, "_upload_stream", fake_upload)
+    before = _other_threads()
+
+    with pytest.raises(PermissionError):
+        files_plugin.upload_directory("http://localhost", tmp_path)
+
+    _wait_for_threads([t for t in _other_threads() if t not in before])
+
+
+def test_upload_directory_stops_zip_thread_when_upload_fails(monkeypatch, tmp_path: Path):
+    def endless_zip(_dir_path, target, buffer_size):
+        while True:
+            target.write(b"x" * buffer_size)
+
+    @thread()
+    def failing_upload(_url, chunks, _headers):
+        next(iter(chunks))
+        msg = "connection lost"
+        raise ConnectionError(msg)
+
+    monkeypatch.setattr(files_plugin, "_write_zip", endless_zip)
+    monkeypatch.setattr(files_plugin, "_upload_stream", failing_upload)
+    before = _other_threads()
+
+    with pytest.raises(ConnectionError, match="connection lost"):
+        files_plugin.upload_directory("http://localhost", tmp_path)
+
+    _wait_for_threads([t for t in _other_threads() if t not in before])
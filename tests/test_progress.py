@@ -0,0 +1,43 @@
+# SPDX-FileCopyrightText: 2023-present Remco Boerma <remco.b@educationwarehouse.nl>
+#
+# SPDX-License-Identifier: MIT
+import gzip
+import io
+import shutil
+
+from urllib3 import HTTPResponse
+
+from edwh_files_plugin.files_plugin import BUFFER_SIZE, ProgressReader
+
+
+class _Bar:
+    """
+    Records progress like progress.bar.ChargingBar, without drawing it.
+    """
+
+    def __init__(self, size: int):
+        self.max = size
+        self.index = 0
+
+    def goto(self, index: int):
+        self.index = index
+
+
+def test_progress_of_gzip_encoded_download_ends_at_content_length():
+    body = b"hello world\n" * 500_000
+    encoded = gzip.compress(body)
+    raw = HTTPResponse(
+        io.BytesIO(encoded),
+        headers={"Content-Encoding": "gzip", "Content-Length": str(len(encoded))},
+        status=200,
+        preload_content=False,
+        decode_content=True,
+    )
+    downloaded = io.BytesIO()
+    bar = _Bar(len(encoded))
+
+    shutil.copyfileobj(ProgressReader(raw, bar), downloaded, BUFFER_SIZE)
+
+    assert downloaded.getvalue() == body
+    # the bar follows the encoded bytes from the Content-Length, not the (much larger) decoded body:
+    assert bar.index == bar.max
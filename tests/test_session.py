@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2023-present Remco Boerma <remco.b@educationwarehouse.nl>
+#
+# SPDX-License-Identifier: MIT
+import http.server
+import ssl
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+from urllib3.connection import HTTPConnection
+
+from edwh_files_plugin import files_plugin
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_PUT(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def put_attempts(monkeypatch) -> list[bytes]:
+    """
+    Make every PUT fail with a TLS error after the first block of its body was sent.
+
+    Returns the list of attempted requests (their first line), which grows with every retry.
+    """
+    attempts: list[bytes] = []
+    original_send = HTTPConnection.send
+
+    def send(self, data):
+        if isinstance(data, bytes) and data.startswith(b"PUT "):
+            attempts.append(data.split(b"\r\n", 1)[0])
+            self._blocks_sent = 0
+        elif getattr(self, "_blocks_sent", None) is not None:
+            self._blocks_sent += 1
+            if self._blocks_sent > 1:
+                raise ssl.SSLEOFError(8, "EOF occurred in violation of protocol")
+
+        return original_send(self, data)
+
+    monkeypatch.setattr(HTTPConnection, "send", send)
+    return attempts
+
+
+def test_upload_file_is_not_retried_after_partial_body(server_url: str, put_attempts: list[bytes], tmp_path: Path):
+    filepath = tmp_path / "large.bin"
+    filepath.write_bytes(b"x" * 4 * files_plugin.BUFFER_SIZE)
+
+    with pytest.raises(requests.exceptions.SSLError):
+        files_plugin.upload_file(server_url, filepath.name, filepath)
+
+    assert len(put_attempts) == 1
+
+
+def test_upload_directory_is_not_retried_after_partial_body(server_url: str, put_attempts: list[bytes], tmp_path: Path):
+    (tmp_path / "large.bin").write_bytes(b"x" * 4 * files_plugin.BUFFER_SIZE)
+
+    with pytest.raises(requests.exceptions.SSLError):
+        files_plugin.upload_directory(server_url, tmp_path)
+
+    assert len(put_attempts) == 1
@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2023-present Remco Boerma <remco.b@educationwarehouse.nl>
+#
+# SPDX-License-Identifier: MIT
+import io
+import os
+import threading
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from edwh_files_plugin.files_plugin import BUFFER_SIZE, BlockQueue, _should_deflate, _write_zip
+
+
+@pytest.fixture
+def directory(tmp_path: Path) -> Path:
+    root = tmp_path / "mydir"
+    (root / "sub" / "empty").mkdir(parents=True)
+    (root / "a.txt").write_bytes(b"hello world\n" * 200_000)
+    (root / "sub" / "b.bin").write_bytes(os.urandom(2 * BUFFER_SIZE))
+    (root / "sub" / "c.jpg").write_bytes(b"not really a jpeg")
+    return root
+
+
+def _zip_to_bytes(directory: Path) -> bytes:
+    # small blocks and a short queue, so the writer has to wait for the reader:
+    blocks = BlockQueue(block_size=64 * 1024, max_blocks=2)
+    errors = []
+
+    def writer():
+        try:
+            _write_zip(directory, blocks, buffer_size=16 * 1024)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            blocks.close()
+
+    t = threading.Thread(target=writer)
+    t.start()
+    data = b"".join(blocks)
+    t.join()
+
+    assert not errors
+    return data
+
+
+def test_write_zip_to_block_queue(directory: Path):
+    data = _zip_to_bytes(directory)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == [
+            "a.txt",
+            "sub/",
+            "sub/b.bin",
+            "sub/c.jpg",
+            "sub/empty/",
+        ]
+        assert archive.read("sub/b.bin") == (directory / "sub" / "b.bin").read_bytes()
+
+        compression = {info.filename: info.compress_type for info in archive.infolist() if not info.is_dir()}
+
+    assert compression == {
+        "a.txt": zipfile.ZIP_DEFLATED,
+        "sub/b.bin": zipfile.ZIP_STORED,
+        "sub/c.jpg": zipfile.ZIP_STORED,
+    }
+
+
+def test_should_deflate(tmp_path: Path):
+    compressed_format = tmp_path / "photo.JPG"
+    compressed_format.write_bytes(b"a" * 100)
+    assert not _should_deflate(str(compressed_format), 100)
+
+    small = tmp_path / "small.bin"
+    small.write_bytes(os.urandom(1024))
+    assert _should_deflate(str(small), 1024)
+
+    compressible = tmp_path / "large.txt"
+    compressible.write_bytes(b"hello world\n" * 200_000)
+    assert _should_deflate(str(compressible), compressible.stat().st_size)
+
+    random = tmp_path / "large.bin"
+    random.write_bytes(os.urandom(2 * BUFFER_SIZE))
+    assert not _should_deflate(str(random), random.stat().st_size)